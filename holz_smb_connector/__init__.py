@@ -1 +1,12 @@
-from holz_smb_connector.smb_connector import SMBConnector, SMBConnection, SMBSettings
+from holz_smb_connector.smb_connector import SMBConnector, SMBSettings
+from holz_smb_connector.async_smb_connector import AsyncSMBConnector
+from holz_smb_connector.pool import SMBConnectionPool
+
+
+def __getattr__(name: str):
+    # SMBConnection is re-exported lazily so importing the package does not load pysmb
+    if name == "SMBConnection":
+        from smb.SMBConnection import SMBConnection
+
+        return SMBConnection
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
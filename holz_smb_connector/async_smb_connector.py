@@ -0,0 +1,126 @@
+import asyncio
+from collections.abc import AsyncIterator, Callable, Iterable
+from contextlib import asynccontextmanager
+from typing import IO, Any, TypeVar
+
+from holz_smb_connector.smb_connector import FileSource, SMBConnector, SMBFile
+
+T = TypeVar("T")
+
+_NO_SPARE = object()
+
+
+def _retrieve_file_bytes(connector: SMBConnector, path: str) -> bytes:
+    return connector.retrieve_file_bytes(path)
+
+
+def _store_file(connector: SMBConnector, path: str, file_obj: FileSource) -> bool:
+    return connector.store_file(path, file_obj)
+
+
+class AsyncSMBConnector:
+    connector_class: type[SMBConnector] = SMBConnector
+
+    def __init__(
+        self,
+        username: str = None,
+        password: str = None,
+        host: str = None,
+        shared_folder: str = None,
+        port: int = 445,
+        work_dir: str = "",
+    ):
+        self._connector_kwargs = dict(
+            username=username,
+            password=password,
+            host=host,
+            shared_folder=shared_folder,
+            port=port,
+            work_dir=work_dir,
+        )
+        self.connector = self.connector_class(**self._connector_kwargs)
+        # pysmb connection serves one request at a time, so calls on it are serialized
+        self._lock = asyncio.Lock()
+
+    async def __aenter__(self):
+        await asyncio.to_thread(self.connector.__enter__)
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await asyncio.to_thread(self.connector.__exit__, exc_type, exc_val, exc_tb)
+
+    async def _run(self, func: Callable[..., T], *args: Any) -> T:
+        async with self._lock:
+            return await asyncio.to_thread(func, *args)
+
+    async def list_dir(self, path: str = "") -> list[SMBFile]:
+        return await self._run(self.connector.list_dir, path)
+
+    @asynccontextmanager
+    async def retrieve_file(self, path: str) -> AsyncIterator[IO[bytes]]:
+        async with self._lock:
+            file_ctx = self.connector.retrieve_file(path)
+            file_obj = await asyncio.to_thread(file_ctx.__enter__)
+        try:
+            yield file_obj
+        finally:
+            await asyncio.to_thread(file_ctx.__exit__, None, None, None)
+
+    async def retrieve_file_bytes(self, path: str) -> bytes:
+        return await self._run(self.connector.retrieve_file_bytes, path)
+
+    async def store_file(self, path: str, file_obj: FileSource) -> bool:
+        return await self._run(self.connector.store_file, path, file_obj)
+
+    async def delete_files(self, file_pattern: str, delete_folders: bool = False) -> None:
+        await self._run(self.connector.delete_files, file_pattern, delete_folders)
+
+    async def delete_many(
+        self, file_patterns: Iterable[str], delete_folders: bool = False, max_concurrency: int = 4
+    ) -> None:
+        await self._run(self.connector.delete_many, list(file_patterns), delete_folders, max_concurrency)
+
+    async def create_dir(self, path: str) -> None:
+        await self._run(self.connector.create_dir, path)
+
+    async def delete_dir(self, path: str) -> None:
+        await self._run(self.connector.delete_dir, path)
+
+    async def copy_file(self, old_path: str, new_path: str) -> None:
+        await self._run(self.connector.copy_file, old_path, new_path)
+
+    async def move_file(self, old_path: str, new_path: str) -> None:
+        await self._run(self.connector.move_file, old_path, new_path)
+
+    async def store_many(self, items: Iterable[tuple[str, FileSource]], max_concurrency: int = 4) -> list[bool]:
+        items = list(items)
+        # items stored through pooled connectors bypass self.connector, its cached listings are dropped here
+        async with self._lock:
+            for path, _ in items:
+                self.connector._invalidate(self.connector._prefix + path)
+        return await self._map(_store_file, items, max_concurrency)
+
+    async def retrieve_many(self, paths: Iterable[str], max_concurrency: int = 4) -> list[bytes]:
+        return await self._map(_retrieve_file_bytes, [(path,) for path in paths], max_concurrency)
+
+    def _call_spare(self, func: Callable[..., T], *args: Any) -> T | object:
+        # runs the item on a spare pooled connection, without entering a with block any connection will do
+        connector = self.connector_class(**self._connector_kwargs)
+        with connector._borrow(blocking=self.connector.conn is None) as conn:
+            if conn is None:
+                return _NO_SPARE
+            connector.conn = conn
+            return func(connector, *args)
+
+    async def _map(self, func: Callable[..., T], args_list: list[tuple], max_concurrency: int) -> list[T]:
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def run(args: tuple) -> T:
+            async with semaphore:
+                result = await asyncio.to_thread(self._call_spare, func, *args)
+                if result is _NO_SPARE:
+                    # waiting for the pool could block forever while self.connector holds the last slot
+                    result = await self._run(func, self.connector, *args)
+                return result
+
+        return await asyncio.gather(*(run(args) for args in args_list))
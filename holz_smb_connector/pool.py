@@ -0,0 +1,127 @@
+from __future__ import annotations
+
+import threading
+import time
+from collections import deque
+from collections.abc import Callable
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from smb.SMBConnection import SMBConnection
+
+PoolKey = tuple[str, int, str, str, str]
+
+
+class SMBConnectionPool:
+    def __init__(
+        self,
+        min_size: int = 0,
+        max_size: int = 8,
+        idle_timeout: float = 60.0,
+        health_check_after: float = 1.0,
+        acquire_timeout: float | None = 30.0,
+    ):
+        self.min_size = min_size
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        # connections released more recently than this are handed out without an echo round trip
+        self.health_check_after = health_check_after
+        # acquire raises TimeoutError instead of waiting longer than this for a connection, None waits forever
+        self.acquire_timeout = acquire_timeout
+        self._idle: dict[PoolKey, deque[tuple[SMBConnection, float]]] = {}
+        self._open: dict[PoolKey, int] = {}
+        self._cond = threading.Condition()
+        self._reaper: threading.Thread | None = None
+
+    def acquire(self, key: PoolKey, connect: Callable[[], SMBConnection]) -> SMBConnection:
+        return self._checkout(key, connect, blocking=True)
+
+    def try_acquire(self, key: PoolKey, connect: Callable[[], SMBConnection]) -> SMBConnection | None:
+        # returns None instead of waiting when every connection of the key is in use
+        return self._checkout(key, connect, blocking=False)
+
+    def _checkout(self, key: PoolKey, connect: Callable[[], SMBConnection], blocking: bool) -> SMBConnection | None:
+        deadline = None if self.acquire_timeout is None else time.monotonic() + self.acquire_timeout
+        with self._cond:
+            self._start_reaper()
+            while True:
+                idle = self._idle.get(key)
+                if idle:
+                    conn, released_at = idle.pop()
+                    break
+                if self._open.get(key, 0) < self.max_size:
+                    self._open[key] = self._open.get(key, 0) + 1
+                    conn = None
+                    break
+                if not blocking:
+                    return None
+                timeout = None if deadline is None else deadline - time.monotonic()
+                if timeout is not None and timeout <= 0:
+                    host, port, shared_folder = key[:3]
+                    raise TimeoutError(
+                        f"no connection to {host}:{port}/{shared_folder} became free within {self.acquire_timeout}s"
+                    )
+                self._cond.wait(timeout)
+
+        if conn is not None:
+            if time.monotonic() - released_at < self.health_check_after or self._is_alive(conn):
+                return conn
+            # the dead connection keeps its slot, a fresh one is opened in its place
+            conn.close()
+        try:
+            return connect()
+        except BaseException:
+            self._free_slot(key)
+            raise
+
+    def release(self, key: PoolKey, conn: SMBConnection) -> None:
+        with self._cond:
+            self._idle.setdefault(key, deque()).append((conn, time.monotonic()))
+            self._cond.notify()
+
+    def discard(self, key: PoolKey, conn: SMBConnection) -> None:
+        conn.close()
+        self._free_slot(key)
+
+    def close(self) -> None:
+        with self._cond:
+            idle, self._idle = self._idle, {}
+            for key, connections in idle.items():
+                self._open[key] -= len(connections)
+            self._cond.notify_all()
+        for connections in idle.values():
+            for conn, _ in connections:
+                conn.close()
+
+    def _free_slot(self, key: PoolKey) -> None:
+        with self._cond:
+            self._open[key] -= 1
+            self._cond.notify()
+
+    @staticmethod
+    def _is_alive(conn: SMBConnection) -> bool:
+        try:
+            conn.echo(b"ping")
+        except Exception:
+            return False
+        return True
+
+    def _start_reaper(self) -> None:
+        if self._reaper is None:
+            self._reaper = threading.Thread(target=self._reap, name="smb-pool-reaper", daemon=True)
+            self._reaper.start()
+
+    def _reap(self) -> None:
+        while True:
+            time.sleep(self.idle_timeout / 2)
+            stale = []
+            deadline = time.monotonic() - self.idle_timeout
+            with self._cond:
+                for key, connections in self._idle.items():
+                    # connections are appended on release, so the oldest ones sit on the left
+                    while len(connections) > self.min_size and connections[0][1] < deadline:
+                        stale.append(connections.popleft()[0])
+                        self._open[key] -= 1
+                self._cond.notify_all()
+            for conn in stale:
+                conn.close()
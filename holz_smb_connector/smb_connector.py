@@ -1,33 +1,146 @@
+from __future__ import annotations
+
+import hashlib
+import io
+import mmap
 import os
+import posixpath
+import queue
+import socket
 import tempfile
-from collections.abc import Iterator
+import threading
+import time
+from collections import OrderedDict, deque
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from contextlib import contextmanager
 from dataclasses import dataclass
-from typing import IO
+from functools import lru_cache
+from itertools import accumulate
+from typing import IO, TYPE_CHECKING, TypeVar
+
+from pydantic import Field
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+from holz_smb_connector.pool import SMBConnectionPool
+
+# pysmb is imported on first use, so SMBSettings and SMBFile stay cheap to import
+if TYPE_CHECKING:
+    from smb.base import SharedFile
+    from smb.smb_structs import OperationFailure
+    from smb.SMBConnection import SMBConnection
+
+T = TypeVar("T")
+
+FileSource = IO | bytes | bytearray | memoryview | str | os.PathLike
+
+
+def __getattr__(name: str):
+    if name == "SMBConnection":
+        from smb.SMBConnection import SMBConnection
+
+        return SMBConnection
+    if name == "OperationFailure":
+        from smb.smb_structs import OperationFailure
+
+        return OperationFailure
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# errors after which a connection must not be handed back to the pool, local file errors leave it intact
+def _connection_errors() -> tuple[type[BaseException], ...]:
+    from smb.base import NotConnectedError, SMBTimeout
+
+    return ConnectionError, socket.timeout, NotConnectedError, SMBTimeout
+
+
+# temporary files kept open per connector for reuse by retrieve_file
+_TMP_FILES_KEPT = 4
+
+_LISTDIR_CACHE_SIZE = 128
+
+_SPECIAL_DIRS = frozenset((".", ".."))
+
+_STATUS_INVALID_DEVICE_REQUEST = 0xC0000010
+_STATUS_OBJECT_NAME_COLLISION = 0xC0000035
+_STATUS_NOT_SUPPORTED = 0xC00000BB
+_STATUS_NOT_SAME_DEVICE = 0xC00000D4
+_COPYCHUNK_UNSUPPORTED = (_STATUS_INVALID_DEVICE_REQUEST, _STATUS_NOT_SUPPORTED)
+# rename does not replace an existing target and cannot cross volumes, copy+delete covers both
+_RENAME_FALLBACK = (_STATUS_NOT_SAME_DEVICE, _STATUS_OBJECT_NAME_COLLISION)
+
+
+def _nt_status(error: OperationFailure) -> int | None:
+    for message in reversed(error.smb_messages):
+        status = message.status
+        if not isinstance(status, int):
+            # SMB1 messages carry an SMBError object instead of the plain NTSTATUS value
+            status = status.internal_value
+        if status:
+            return status
+    return None
+
+
+def _normalize_path(path: str) -> str:
+    # one spelling per directory for the list_dir cache, whatever the leading, trailing or doubled slashes
+    return "/".join(name for name in path.split("/") if name)
+
 
-from pydantic_settings import BaseSettings
-from smb.smb_structs import OperationFailure
-from smb.SMBConnection import SMBConnection
+def _unc_path(share: str, path: str) -> str:
+    relative_path = path.replace("/", "\\").strip("\\")
+    return f"{share}\\{relative_path}"
 
 
-@dataclass
+class _BufferWriter:
+    def __init__(self, buffer: mmap.mmap, offset: int):
+        self.buffer = buffer
+        self.offset = offset
+
+    def write(self, data: bytes) -> int:
+        start, end = self.offset, self.offset + len(data)
+        self.buffer[start:end] = data
+        self.offset = end
+        return len(data)
+
+
+@dataclass(slots=True, frozen=True)
 class SMBFile:
     name: str
     is_dir: bool
     read_only: bool
 
+    @classmethod
+    def from_shared_file(cls, f: SharedFile) -> SMBFile:
+        return cls(f.filename, f.isDirectory, f.isReadOnly)
+
 
 class SMBSettings(BaseSettings):
+    model_config = SettingsConfigDict(str_strip_whitespace=True, frozen=True)
+
     username: str = ""
     password: str = ""
     shared_folder: str = ""
     work_dir: str = ""
     host: str = ""
     port: int = 445
+    tmp_spool_max: int = 4 * 1024 * 1024
+    # per-request caps for SMB2 reads / writes: they can only lower the size negotiated with the server,
+    # never raise it, so they bound the request size rather than tune throughput
+    read_buffer_size: int = 1024 * 1024
+    write_buffer_size: int = 1024 * 1024
+    connect_timeout: float = 5.0
+    connect_attempts: int = Field(default=3, ge=1)
+    listdir_ttl: float = 0.0
+
+
+@lru_cache
+def _default_settings() -> SMBSettings:
+    return SMBSettings()
 
 
 class SMBConnector:
     settings: SMBSettings = None
+    pool: SMBConnectionPool | None = SMBConnectionPool()
 
     def __init__(
         self,
@@ -38,90 +151,432 @@ class SMBConnector:
         port: int = 445,
         work_dir: str = "",
     ):
-        self.conn = SMBConnection(
-            username=username if username else self.settings.username.strip(),
-            password=password if password else self.settings.password.strip(),
-            my_name="server_host",
-            remote_name="target_host",
-            is_direct_tcp=True,
-        )
-        self.shared_folder = shared_folder if shared_folder else self.settings.shared_folder.strip()
-        self.work_dir = work_dir if work_dir else self.settings.work_dir.strip()
-        self.host = host if host else self.settings.host.strip()
+        if self.settings is None:
+            self.settings = _default_settings()
+        self.username = username if username else self.settings.username
+        self.password = password if password else self.settings.password
+        self.shared_folder = shared_folder if shared_folder else self.settings.shared_folder
+        self.work_dir = work_dir if work_dir else self.settings.work_dir
+        self.host = host if host else self.settings.host
         self.port = port if port else self.settings.port
+        self._prefix = f"{self.work_dir.rstrip('/')}/" if self.work_dir else ""
+        self.conn: SMBConnection | None = None
+        self._server_side_copy = True
+        # smbprotocol keeps its own session for server-side copies, it is private to the connector and closed on exit
+        self._copy_connections: dict[str, object] = {}
+        self._tmp_files: deque[IO[bytes]] = deque()
+        self._listdir_cache: OrderedDict[str, tuple[float, list[SMBFile]]] = OrderedDict()
+        # the password is part of the key, so a session is only reused by callers holding the same credentials
+        password_hash = hashlib.sha256(self.password.encode()).hexdigest()
+        self._pool_key = (self.host, self.port, self.shared_folder, self.username, password_hash)
 
     def __enter__(self):
-        assert self.conn.connect(ip=self.host, port=self.port)
+        self.conn = self._acquire()
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        self.conn.close()
+        self._release(self.conn, exc_type)
+        self.conn = None
+        while self._tmp_files:
+            self._tmp_files.pop().close()
+        if self._copy_connections:
+            import smbclient
+
+            smbclient.delete_session(self.host, port=self.port, connection_cache=self._copy_connections)
+
+    def _acquire_tmp(self) -> IO[bytes]:
+        if self._tmp_files:
+            return self._tmp_files.pop()
+        return tempfile.NamedTemporaryFile()
+
+    def _release_tmp(self, file_obj: IO[bytes]) -> None:
+        if file_obj.closed:
+            return
+        if len(self._tmp_files) >= _TMP_FILES_KEPT:
+            file_obj.close()
+            return
+        file_obj.seek(0)
+        file_obj.truncate()
+        self._tmp_files.append(file_obj)
+
+    def _acquire(self, blocking: bool = True) -> SMBConnection | None:
+        if self.pool is None:
+            return self._connect()
+        if blocking:
+            return self.pool.acquire(self._pool_key, self._connect)
+        return self.pool.try_acquire(self._pool_key, self._connect)
+
+    def _release(self, conn: SMBConnection, exc_type: type[BaseException] | None = None) -> None:
+        if self.pool is None:
+            conn.close()
+        elif exc_type is not None and issubclass(exc_type, _connection_errors()):
+            self.pool.discard(self._pool_key, conn)
+        else:
+            self.pool.release(self._pool_key, conn)
+
+    @contextmanager
+    def _borrow(self, blocking: bool = True) -> Iterator[SMBConnection | None]:
+        conn = self._acquire(blocking)
+        if conn is None:
+            yield None
+            return
+        try:
+            yield conn
+        except BaseException as e:
+            self._release(conn, type(e))
+            raise
+        else:
+            self._release(conn)
+
+    @contextmanager
+    def _borrow_spare(self, own_lock: threading.Lock) -> Iterator[SMBConnection]:
+        # outside a with block any pooled connection will do, inside it waiting for one could block forever
+        # while this connector holds the last slot, so the own connection serves when the pool has none to spare
+        if self.conn is None:
+            with self._borrow() as conn:
+                yield conn
+            return
+        with self._borrow(blocking=False) as conn:
+            if conn is not None:
+                yield conn
+                return
+        with own_lock:
+            yield self.conn
+
+    def _connect(self) -> SMBConnection:
+        from smb.SMBConnection import SMBConnection
+
+        delay = 0.1
+        for attempt in range(1, self.settings.connect_attempts + 1):
+            conn = SMBConnection(
+                username=self.username,
+                password=self.password,
+                my_name="server_host",
+                remote_name="target_host",
+                is_direct_tcp=True,
+            )
+            # connecting only touches the socket, so every OSError here is a network error
+            try:
+                authenticated = conn.connect(ip=self.host, port=self.port, timeout=self.settings.connect_timeout)
+            except (OSError, *_connection_errors()):
+                conn.close()
+                if attempt == self.settings.connect_attempts:
+                    raise
+                time.sleep(delay)
+                delay = min(delay * 2, 1.0)
+                continue
+            if not authenticated:
+                conn.close()
+                raise ConnectionError(f"SMB authentication on {self.host}:{self.port} failed")
+            if conn.isUsingSMB2:
+                # the sizes negotiated with the server are the upper bound, a request may not exceed them
+                conn.max_read_size = min(conn.max_read_size, self.settings.read_buffer_size)
+                conn.max_write_size = min(conn.max_write_size, self.settings.write_buffer_size)
+            return conn
 
     def list_dir(self, path: str = "") -> list[SMBFile]:
-        full_path = os.path.join(self.work_dir, path)
+        ttl = self.settings.listdir_ttl
+        if not ttl:
+            return list(self.listdir_iter(path))
+        key = _normalize_path(self._prefix + path)
+        now = time.monotonic()
+        cached = self._listdir_cache.get(key)
+        if cached is not None and now - cached[0] < ttl:
+            self._listdir_cache.move_to_end(key)
+            return list(cached[1])
+        files = list(self.listdir_iter(path))
+        self._listdir_cache[key] = (now, files)
+        self._listdir_cache.move_to_end(key)
+        if len(self._listdir_cache) > _LISTDIR_CACHE_SIZE:
+            self._listdir_cache.popitem(last=False)
+        return list(files)
+
+    def _invalidate(self, full_path: str) -> None:
+        # drops the cached listing of the parent directory and of the path itself with everything below it
+        if not self._listdir_cache:
+            return
+        path = _normalize_path(full_path)
+        if not path:
+            self._listdir_cache.clear()
+            return
+        self._listdir_cache.pop(posixpath.dirname(path), None)
+        subtree = f"{path}/"
+        for key in [key for key in self._listdir_cache if key == path or key.startswith(subtree)]:
+            del self._listdir_cache[key]
+
+    def listdir_iter(self, path: str = "") -> Iterator[SMBFile]:
+        full_path = self._prefix + path
         _files_list = self.conn.listPath(self.shared_folder, full_path)
-        files_list = [
-            SMBFile(
-                name=f.filename,
-                is_dir=f.isDirectory,
-                read_only=f.isReadOnly,
-            )
-            for f in _files_list
-        ]
-        for file in files_list[:]:
-            if file.is_dir and file.name in (".", ".."):
-                files_list.remove(file)
-        return files_list
+        return (SMBFile.from_shared_file(f) for f in _files_list if not (f.isDirectory and f.filename in _SPECIAL_DIRS))
+
+    def walk(self, path: str = "") -> Iterator[tuple[str, list[SMBFile], list[SMBFile]]]:
+        pending = deque([path])
+        while pending:
+            dir_path = pending.popleft()
+            dirs: list[SMBFile] = []
+            files: list[SMBFile] = []
+            for entry in self.listdir_iter(dir_path):
+                (dirs if entry.is_dir else files).append(entry)
+            yield dir_path, dirs, files
+            # like os.walk, subdirectories removed from dirs by the caller are not visited
+            pending.extend(posixpath.join(dir_path, d.name) for d in dirs)
 
     @contextmanager
     def retrieve_file(self, path: str) -> Iterator[IO[bytes]]:
-        full_path = "/".join([self.work_dir, path])
-        file_obj = tempfile.NamedTemporaryFile()
+        full_path = self._prefix + path
+        file_obj = self._acquire_tmp()
         try:
             _, _ = self.conn.retrieveFile(self.shared_folder, full_path, file_obj)
             file_obj.seek(0)
             yield file_obj.file
         finally:
-            file_obj.close()
+            self._release_tmp(file_obj)
 
-    def store_file(self, path: str, file_obj: IO) -> bool:
-        if self.work_dir:
-            full_path = "/".join([self.work_dir, path])
-        else:
-            full_path = path
-        bytes_count = self.conn.storeFile(self.shared_folder, full_path, file_obj)
+    def retrieve_file_bytes(self, path: str) -> bytes:
+        full_path = self._prefix + path
+        # the content ends up in memory anyway, so it is received there directly instead of through a temporary file
+        file_obj = io.BytesIO()
+        self.conn.retrieveFile(self.shared_folder, full_path, file_obj)
+        return file_obj.getvalue()
+
+    @contextmanager
+    def retrieve_file_parallel(
+        self, path: str, *, block_size: int = 1 << 20, max_requests: int = 8
+    ) -> Iterator[IO[bytes]]:
+        full_path = self._prefix + path
+        size = self.conn.getAttributes(self.shared_folder, full_path).file_size
+        file_obj = self._acquire_tmp()
+        try:
+            if size:
+                file_obj.truncate(size)
+                with mmap.mmap(file_obj.fileno(), size) as buffer:
+
+                    def read_block(conn: SMBConnection, offset: int) -> None:
+                        writer = _BufferWriter(buffer, offset)
+                        conn.retrieveFileFromOffset(self.shared_folder, full_path, writer, offset, block_size)
+
+                    self._distribute(range(0, size, block_size), max_requests, read_block)
+            file_obj.seek(0)
+            yield file_obj.file
+        finally:
+            self._release_tmp(file_obj)
+
+    def _distribute(self, items: Iterable[T], max_workers: int, func: Callable[[SMBConnection, T], None]) -> None:
+        # pysmb waits for every response before sending the next request, so each
+        # outstanding request needs its own connection
+        pending: queue.SimpleQueue[T] = queue.SimpleQueue()
+        for item in items:
+            pending.put(item)
+        failed = threading.Event()
+
+        def drain(conn: SMBConnection) -> None:
+            while not failed.is_set():
+                try:
+                    item = pending.get_nowait()
+                except queue.Empty:
+                    return
+                try:
+                    func(conn, item)
+                except BaseException:
+                    failed.set()
+                    raise
+
+        def drain_borrowed() -> None:
+            if pending.empty() or failed.is_set():
+                return
+            # helpers only take connections the pool can spare right away, waiting for one
+            # could block forever while the connectors holding them wait for this call
+            with self._borrow(blocking=False) as conn:
+                if conn is not None:
+                    drain(conn)
+
+        workers = min(max_workers, pending.qsize())
+        if self.pool is not None:
+            # helpers beyond the pool size would never get a connection
+            workers = min(workers, self.pool.max_size)
+        with ThreadPoolExecutor(max_workers=max(workers - 1, 1)) as executor:
+            futures = [executor.submit(drain_borrowed) for _ in range(workers - 1)]
+            # the connector's own connection drains whatever the helpers leave, so the work
+            # completes even when the pool has no spare connections
+            drain(self.conn)
+            for future in futures:
+                future.result()
+
+    def store_file(self, path: str, file_obj: FileSource) -> bool:
+        full_path = self._prefix + path
+        self._invalidate(full_path)
+        with self._open_source(file_obj) as source:
+            bytes_count = self.conn.storeFile(self.shared_folder, full_path, source)
         if bytes_count:
             return True
         return False
 
+    @contextmanager
+    def _open_source(self, file_obj: FileSource) -> Iterator[IO[bytes]]:
+        if isinstance(file_obj, str | os.PathLike):
+            with open(file_obj, "rb", buffering=self.settings.write_buffer_size) as source:
+                yield source
+        elif isinstance(file_obj, bytes):
+            # BytesIO shares the buffer of an immutable bytes object instead of copying it
+            yield io.BytesIO(file_obj)
+        elif isinstance(file_obj, bytearray | memoryview):
+            if memoryview(file_obj).nbytes <= self.settings.tmp_spool_max:
+                yield io.BytesIO(file_obj)
+                return
+            # a mutable buffer would be copied by BytesIO, spool large ones to disk instead
+            with tempfile.SpooledTemporaryFile(max_size=self.settings.tmp_spool_max) as source:
+                source.write(file_obj)
+                source.seek(0)
+                yield source
+        else:
+            yield file_obj
+
+    def put_many(
+        self, items: Iterable[tuple[str, FileSource]], *, max_concurrency: int = 8
+    ) -> list[tuple[str, bool, int]]:
+        own_lock = threading.Lock()
+
+        def put(path: str, file_obj: FileSource) -> int:
+            with self._borrow_spare(own_lock) as conn, self._open_source(file_obj) as source:
+                return conn.storeFile(self.shared_folder, self._prefix + path, source)
+
+        items = list(items)
+        for path, _ in items:
+            self._invalidate(self._prefix + path)
+        return self._run_many(put, items, max_concurrency)
+
+    def get_many(
+        self, items: Iterable[tuple[str, IO[bytes]]], *, max_concurrency: int = 8
+    ) -> list[tuple[str, bool, int]]:
+        own_lock = threading.Lock()
+
+        def get(path: str, file_obj: IO[bytes]) -> int:
+            with self._borrow_spare(own_lock) as conn:
+                _, bytes_count = conn.retrieveFile(self.shared_folder, self._prefix + path, file_obj)
+            return bytes_count
+
+        return self._run_many(get, items, max_concurrency)
+
+    def _run_many(
+        self, func: Callable[[str, T], int], items: Iterable[tuple[str, T]], max_concurrency: int
+    ) -> list[tuple[str, bool, int]]:
+        from smb.smb_structs import OperationFailure
+
+        # every transfer runs on a spare pooled connection or the connector's own one,
+        # so at most max_concurrency requests are in flight
+        failures = (OperationFailure, OSError, *_connection_errors())
+        results = []
+        with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+            futures = {executor.submit(func, path, file_obj): path for path, file_obj in items}
+            for future in as_completed(futures):
+                try:
+                    results.append((futures[future], True, future.result()))
+                except failures:
+                    results.append((futures[future], False, 0))
+        return results
+
     def delete_files(self, file_pattern: str, delete_folders: bool = False) -> None:
-        full_pattern = "/".join([self.work_dir, file_pattern])
+        full_pattern = self._prefix + file_pattern
+        self._invalidate(posixpath.dirname(full_pattern))
         self.conn.deleteFiles(self.shared_folder, full_pattern, delete_folders)
 
+    def delete_many(self, file_patterns: Iterable[str], delete_folders: bool = False, max_concurrency: int = 4) -> None:
+        def delete(conn: SMBConnection, full_pattern: str) -> None:
+            conn.deleteFiles(self.shared_folder, full_pattern, delete_folders)
+
+        full_patterns = [self._prefix + pattern for pattern in file_patterns]
+        for full_pattern in full_patterns:
+            self._invalidate(posixpath.dirname(full_pattern))
+        self._distribute(full_patterns, max_concurrency, delete)
+
     def create_dir(self, path: str) -> None:
-        full_path = "/".join([self.work_dir, path])
-        dirs = full_path.split("/")
-        current_path = ""
-        while dirs:
-            current_path += f"{dirs.pop(0)}/"
+        from smb.smb_structs import OperationFailure
+
+        full_path = self._prefix + path
+        dirs = list(accumulate((name for name in full_path.split("/") if name), lambda a, b: f"{a}/{b}"))
+        # existing directories form a leading run of the chain, find where it ends with a binary search
+        low, high = 0, len(dirs)
+        while low < high:
+            middle = (low + high) // 2
+            if self._exists(dirs[middle]):
+                low = middle + 1
+            else:
+                high = middle
+        if low < len(dirs):
+            self._invalidate(dirs[low])
+        for current_path in dirs[low:]:
             try:
                 self.conn.createDirectory(self.shared_folder, current_path)
-            except OperationFailure:
-                pass
+            except OperationFailure as e:
+                if _nt_status(e) != _STATUS_OBJECT_NAME_COLLISION:
+                    raise
+
+    def _exists(self, full_path: str) -> bool:
+        from smb.smb_structs import OperationFailure
+
+        try:
+            self.conn.getAttributes(self.shared_folder, full_path)
+        except OperationFailure:
+            return False
+        return True
 
     def delete_dir(self, path: str) -> None:
-        full_path = "/".join([self.work_dir, path])
+        full_path = self._prefix + path
+        self._invalidate(full_path)
         self.conn.deleteDirectory(self.shared_folder, full_path)
 
     def copy_file(self, old_path: str, new_path: str) -> None:
-        full_old_path = "/".join([self.work_dir, old_path])
-        full_new_path = "/".join([self.work_dir, new_path])
-        with tempfile.NamedTemporaryFile() as file_obj:
+        full_old_path = self._prefix + old_path
+        full_new_path = self._prefix + new_path
+        self._invalidate(full_new_path)
+        if self._server_side_copy and self._copy_on_server(full_old_path, full_new_path):
+            return
+        with tempfile.SpooledTemporaryFile(max_size=self.settings.tmp_spool_max) as file_obj:
             self.conn.retrieveFile(self.shared_folder, full_old_path, file_obj)
             file_obj.seek(0)
             self.conn.storeFile(self.shared_folder, full_new_path, file_obj)
 
+    def _copy_on_server(self, full_old_path: str, full_new_path: str) -> bool:
+        # pysmb has no ioctl support, FSCTL_SRV_COPYCHUNK goes through the optional smbprotocol package
+        try:
+            import smbclient
+            from smbprotocol.exceptions import SMBOSError
+        except ImportError:
+            self._server_side_copy = False
+            return False
+        share = rf"\\{self.host}\{self.shared_folder}"
+        try:
+            smbclient.copyfile(
+                _unc_path(share, full_old_path),
+                _unc_path(share, full_new_path),
+                username=self.username,
+                password=self.password,
+                port=self.port,
+                connection_cache=self._copy_connections,
+            )
+        except SMBOSError as e:
+            # errors tied to this file are left to the regular transfer, which reports them the usual way
+            if e.ntstatus in _COPYCHUNK_UNSUPPORTED:
+                self._server_side_copy = False
+            return False
+        except Exception:
+            # authentication and connection failures would repeat on every call, the connector stops trying
+            self._server_side_copy = False
+            return False
+        return True
+
     def move_file(self, old_path: str, new_path: str) -> None:
+        from smb.smb_structs import OperationFailure
+
+        full_old_path = self._prefix + old_path
+        full_new_path = self._prefix + new_path
+        self._invalidate(full_old_path)
+        self._invalidate(full_new_path)
+        try:
+            self.conn.rename(self.shared_folder, full_old_path, full_new_path)
+            return
+        except OperationFailure as e:
+            if _nt_status(e) not in _RENAME_FALLBACK:
+                raise
         self.copy_file(old_path=old_path, new_path=new_path)
-        full_old_path = "/".join([self.work_dir, old_path])
         self.conn.deleteFiles(self.shared_folder, full_old_path)
@@ -0,0 +1,173 @@
+import fnmatch
+import posixpath
+import threading
+import time
+from types import SimpleNamespace
+
+from smb.smb_structs import OperationFailure
+
+from holz_smb_connector import SMBConnector, SMBSettings
+from holz_smb_connector.pool import SMBConnectionPool
+
+STATUS_OBJECT_NAME_NOT_FOUND = 0xC0000034
+STATUS_OBJECT_NAME_COLLISION = 0xC0000035
+
+
+def _normalize(path: str) -> str:
+    return "/".join(name for name in path.split("/") if name)
+
+
+def operation_failure(status: int) -> OperationFailure:
+    """Builds an SMB2 style failure, ``status`` is an int on the last message."""
+    return OperationFailure("fake failure", [SimpleNamespace(status=status)])
+
+
+def smb1_operation_failure(status: int) -> OperationFailure:
+    """Builds an SMB1 style failure, ``status`` is a ``SMBError`` on the last message."""
+    from smb.smb_structs import SMBError
+
+    error = SMBError()
+    error.internal_value = status
+    return OperationFailure("fake failure", [SimpleNamespace(status=error)])
+
+
+class FakeShare:
+    """In-memory share contents, shared by every connection of a fake server."""
+
+    def __init__(self):
+        self.files: dict[str, bytes] = {}
+        self.dirs: set[str] = {""}
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+
+class FakeConnection:
+    isUsingSMB2 = True
+    max_read_size = max_write_size = 1 << 20
+
+    def __init__(self, share: FakeShare | None = None, delay: float = 0.0, smb1: bool = False):
+        self.share = share or FakeShare()
+        self.delay = delay
+        self.smb1 = smb1
+        self.alive = True
+        self.closed = False
+
+    def _fail(self, status: int) -> OperationFailure:
+        return smb1_operation_failure(status) if self.smb1 else operation_failure(status)
+
+    def _request(self) -> None:
+        with self.share.lock:
+            self.share.in_flight += 1
+            self.share.max_in_flight = max(self.share.max_in_flight, self.share.in_flight)
+        time.sleep(self.delay)
+        with self.share.lock:
+            self.share.in_flight -= 1
+
+    def echo(self, data: bytes, timeout: int = 10) -> bytes:
+        if not self.alive:
+            raise ConnectionResetError
+        return data
+
+    def close(self) -> None:
+        self.closed = True
+
+    def listPath(self, service_name, path, **kwargs):
+        self._request()
+        path = _normalize(path)
+        if path not in self.share.dirs:
+            raise self._fail(STATUS_OBJECT_NAME_NOT_FOUND)
+        # like a real server, the listing starts with the directory itself and its parent
+        names = [(".", True), ("..", True)]
+        names += [(posixpath.basename(d), True) for d in sorted(self.share.dirs) if d and posixpath.dirname(d) == path]
+        names += [(posixpath.basename(f), False) for f in sorted(self.share.files) if posixpath.dirname(f) == path]
+        return [SimpleNamespace(filename=name, isDirectory=is_dir, isReadOnly=False) for name, is_dir in names]
+
+    def getAttributes(self, service_name, path, **kwargs):
+        self._request()
+        path = _normalize(path)
+        if path not in self.share.dirs and path not in self.share.files:
+            raise self._fail(STATUS_OBJECT_NAME_NOT_FOUND)
+        return SimpleNamespace(
+            filename=posixpath.basename(path),
+            isDirectory=path in self.share.dirs,
+            file_size=len(self.share.files.get(path, b"")),
+        )
+
+    def createDirectory(self, service_name, path, **kwargs):
+        self._request()
+        path = _normalize(path)
+        if path in self.share.dirs:
+            raise self._fail(STATUS_OBJECT_NAME_COLLISION)
+        self.share.dirs.add(path)
+
+    def deleteDirectory(self, service_name, path, **kwargs):
+        self._request()
+        self.share.dirs.discard(_normalize(path))
+
+    def storeFile(self, service_name, path, file_obj, **kwargs):
+        self._request()
+        data = file_obj.read()
+        self.share.files[_normalize(path)] = data
+        return len(data)
+
+    def retrieveFile(self, service_name, path, file_obj, **kwargs):
+        self._request()
+        path = _normalize(path)
+        if path not in self.share.files:
+            raise self._fail(STATUS_OBJECT_NAME_NOT_FOUND)
+        file_obj.write(self.share.files[path])
+        return 0, len(self.share.files[path])
+
+    def retrieveFileFromOffset(self, service_name, path, file_obj, offset=0, max_length=-1, **kwargs):
+        self._request()
+        data = self.share.files[_normalize(path)][offset:]
+        if max_length >= 0:
+            data = data[:max_length]
+        file_obj.write(data)
+        return 0, len(data)
+
+    def deleteFiles(self, service_name, path_file_pattern, delete_matching_folders=False, **kwargs):
+        self._request()
+        pattern = _normalize(path_file_pattern)
+        for path in fnmatch.filter(list(self.share.files), pattern):
+            del self.share.files[path]
+
+    def rename(self, service_name, old_path, new_path, **kwargs):
+        self._request()
+        old_path, new_path = _normalize(old_path), _normalize(new_path)
+        if new_path in self.share.files:
+            raise self._fail(STATUS_OBJECT_NAME_COLLISION)
+        self.share.files[new_path] = self.share.files.pop(old_path)
+
+
+class FakeConnector:
+    """Counts connections opened through it, used as the ``connect`` callable of a pool."""
+
+    def __init__(self):
+        self.opened: list[FakeConnection] = []
+
+    def __call__(self) -> FakeConnection:
+        conn = FakeConnection()
+        self.opened.append(conn)
+        return conn
+
+
+def fake_connector_class(
+    max_size: int = 8, delay: float = 0.0, smb1: bool = False
+) -> tuple[type[SMBConnector], FakeShare]:
+    """Returns an ``SMBConnector`` subclass with its own pool, connecting to an in-memory share."""
+    share = FakeShare()
+
+    class FakeSMBConnector(SMBConnector):
+        settings = SMBSettings(username="user", password="secret", host="host", shared_folder="share", work_dir="")
+        pool = SMBConnectionPool(max_size=max_size)
+
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self._server_side_copy = False
+
+        def _connect(self) -> FakeConnection:
+            return FakeConnection(share, delay=delay, smb1=smb1)
+
+    return FakeSMBConnector, share
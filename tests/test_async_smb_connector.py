@@ -0,0 +1,75 @@
+import asyncio
+import io
+import unittest
+
+from holz_smb_connector import AsyncSMBConnector
+from tests.fake_smb import fake_connector_class
+
+
+class AsyncSMBConnectorManyTest(unittest.TestCase):
+    def _async_connector(self, max_size: int, delay: float = 0.0, **settings):
+        connector_class, share = fake_connector_class(max_size=max_size, delay=delay)
+        if settings:
+            connector_class.settings = connector_class.settings.model_copy(update=settings)
+
+        class FakeAsyncSMBConnector(AsyncSMBConnector):
+            pass
+
+        FakeAsyncSMBConnector.connector_class = connector_class
+        return FakeAsyncSMBConnector(), share
+
+    def test_store_many_with_concurrency_above_pool_size(self):
+        async_connector, share = self._async_connector(max_size=2, delay=0.01)
+
+        async def run():
+            async with async_connector:
+                return await asyncio.wait_for(
+                    async_connector.store_many(
+                        ((f"file_{i}", io.BytesIO(b"data")) for i in range(20)), max_concurrency=8
+                    ),
+                    5,
+                )
+
+        self.assertEqual(asyncio.run(run()), [True] * 20)
+        self.assertEqual(len(share.files), 20)
+        self.assertLessEqual(share.max_in_flight, 2)
+
+    def test_store_many_with_a_single_pooled_connection(self):
+        async_connector, share = self._async_connector(max_size=1)
+
+        async def run():
+            async with async_connector:
+                return await asyncio.wait_for(
+                    async_connector.store_many([("a", io.BytesIO(b"x")), ("b", io.BytesIO(b"y"))]), 5
+                )
+
+        self.assertEqual(asyncio.run(run()), [True, True])
+        self.assertEqual(share.files, {"a": b"x", "b": b"y"})
+
+    def test_store_many_outside_a_with_block(self):
+        async_connector, share = self._async_connector(max_size=1)
+        self.assertEqual(
+            asyncio.run(async_connector.store_many([("a", io.BytesIO(b"x")), ("b", io.BytesIO(b"y"))])), [True, True]
+        )
+        self.assertEqual(len(share.files), 2)
+
+    def test_retrieve_many_keeps_order(self):
+        async_connector, share = self._async_connector(max_size=4)
+        share.files.update({f"file_{i}": str(i).encode() for i in range(10)})
+
+        async def run():
+            async with async_connector:
+                return await async_connector.retrieve_many([f"file_{i}" for i in range(10)], max_concurrency=3)
+
+        self.assertEqual(asyncio.run(run()), [str(i).encode() for i in range(10)])
+
+    def test_store_many_invalidates_cached_listings(self):
+        async_connector, _ = self._async_connector(max_size=4, listdir_ttl=60.0)
+
+        async def run():
+            async with async_connector:
+                self.assertEqual(await async_connector.list_dir(""), [])
+                await async_connector.store_many([("new", io.BytesIO(b"x"))])
+                return [file.name for file in await async_connector.list_dir("")]
+
+        self.assertEqual(asyncio.run(run()), ["new"])
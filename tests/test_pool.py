@@ -0,0 +1,113 @@
+import threading
+import time
+import unittest
+
+from holz_smb_connector.pool import SMBConnectionPool
+from tests.fake_smb import FakeConnector, fake_connector_class
+
+KEY = ("host", 445, "share", "user", "hash")
+OTHER_KEY = ("host", 445, "share", "user", "other-hash")
+
+
+class SMBConnectionPoolTest(unittest.TestCase):
+    def setUp(self):
+        self.connect = FakeConnector()
+
+    def test_released_connection_is_reused(self):
+        pool = SMBConnectionPool()
+        conn = pool.acquire(KEY, self.connect)
+        pool.release(KEY, conn)
+        self.assertIs(pool.acquire(KEY, self.connect), conn)
+        self.assertEqual(len(self.connect.opened), 1)
+
+    def test_keys_do_not_share_connections(self):
+        pool = SMBConnectionPool()
+        conn = pool.acquire(KEY, self.connect)
+        pool.release(KEY, conn)
+        self.assertIsNot(pool.acquire(OTHER_KEY, self.connect), conn)
+
+    def test_discard_closes_and_frees_slot(self):
+        pool = SMBConnectionPool(max_size=1)
+        conn = pool.acquire(KEY, self.connect)
+        pool.discard(KEY, conn)
+        self.assertTrue(conn.closed)
+        self.assertIsNot(pool.acquire(KEY, self.connect), conn)
+
+    def test_dead_connection_is_replaced(self):
+        pool = SMBConnectionPool(health_check_after=0)
+        conn = pool.acquire(KEY, self.connect)
+        conn.alive = False
+        pool.release(KEY, conn)
+        self.assertIsNot(pool.acquire(KEY, self.connect), conn)
+        self.assertTrue(conn.closed)
+
+    def test_failed_connect_frees_slot(self):
+        pool = SMBConnectionPool(max_size=1)
+
+        def refuse():
+            raise ConnectionRefusedError
+
+        with self.assertRaises(ConnectionRefusedError):
+            pool.acquire(KEY, refuse)
+        pool.acquire(KEY, self.connect)
+
+    def test_exhausted_pool_waits_for_release(self):
+        pool = SMBConnectionPool(max_size=1)
+        conn = pool.acquire(KEY, self.connect)
+        acquired = []
+        waiter = threading.Thread(target=lambda: acquired.append(pool.acquire(KEY, self.connect)))
+        waiter.start()
+        waiter.join(0.1)
+        self.assertTrue(waiter.is_alive())
+        pool.release(KEY, conn)
+        waiter.join(1)
+        self.assertEqual(acquired, [conn])
+
+    def test_exhausted_pool_times_out(self):
+        pool = SMBConnectionPool(max_size=1, acquire_timeout=0.05)
+        conn = pool.acquire(KEY, self.connect)
+        with self.assertRaises(TimeoutError):
+            pool.acquire(KEY, self.connect)
+        pool.release(KEY, conn)
+        self.assertIs(pool.acquire(KEY, self.connect), conn)
+
+    def test_try_acquire_does_not_wait(self):
+        pool = SMBConnectionPool(max_size=1)
+        conn = pool.try_acquire(KEY, self.connect)
+        self.assertIsNotNone(conn)
+        self.assertIsNone(pool.try_acquire(KEY, self.connect))
+        pool.release(KEY, conn)
+        self.assertIs(pool.try_acquire(KEY, self.connect), conn)
+
+    def test_reaper_closes_idle_connections(self):
+        pool = SMBConnectionPool(idle_timeout=0.05)
+        conn = pool.acquire(KEY, self.connect)
+        pool.release(KEY, conn)
+        time.sleep(0.2)
+        self.assertTrue(conn.closed)
+        self.assertIsNot(pool.acquire(KEY, self.connect), conn)
+
+    def test_close_closes_idle_connections(self):
+        pool = SMBConnectionPool()
+        conn = pool.acquire(KEY, self.connect)
+        pool.release(KEY, conn)
+        pool.close()
+        self.assertTrue(conn.closed)
+
+
+class SMBConnectorPoolKeyTest(unittest.TestCase):
+    def test_password_is_part_of_the_key(self):
+        connector_class, _ = fake_connector_class()
+        first = connector_class(password="first")
+        self.assertNotEqual(first._pool_key, connector_class(password="second")._pool_key)
+        self.assertEqual(first._pool_key, connector_class(password="first")._pool_key)
+        self.assertNotIn("first", first._pool_key)
+
+    def test_other_password_does_not_get_the_session(self):
+        connector_class, _ = fake_connector_class()
+        with connector_class(password="first") as connector:
+            conn = connector.conn
+        with connector_class(password="second") as connector:
+            self.assertIsNot(connector.conn, conn)
+        with connector_class(password="first") as connector:
+            self.assertIs(connector.conn, conn)
@@ -0,0 +1,434 @@
+import io
+import pathlib
+import socket
+import sys
+import tempfile
+import threading
+import types
+import unittest
+from unittest import mock
+
+from pydantic import ValidationError
+from smb.smb_structs import OperationFailure
+
+from holz_smb_connector import SMBConnector, SMBSettings
+from holz_smb_connector.smb_connector import SMBFile
+from tests.fake_smb import FakeConnection, fake_connector_class, smb1_operation_failure
+
+
+def run_with_timeout(func, timeout: float = 5):
+    """Runs ``func`` in a daemon thread, so a deadlock fails the test instead of hanging the suite."""
+    result = {}
+
+    def target():
+        try:
+            result["value"] = func()
+        except BaseException as e:
+            result["error"] = e
+
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    if thread.is_alive():
+        raise AssertionError(f"did not finish within {timeout} seconds")
+    if "error" in result:
+        raise result["error"]
+    return result.get("value")
+
+
+class ReleaseTest(unittest.TestCase):
+    def test_local_error_keeps_the_pooled_connection(self):
+        connector_class, _ = fake_connector_class()
+        with self.assertRaises(FileNotFoundError), connector_class() as connector:
+            conn = connector.conn
+            open("/nonexistent/file", "rb")
+        self.assertFalse(conn.closed)
+        with connector_class() as connector:
+            self.assertIs(connector.conn, conn)
+
+    def test_connection_error_discards_the_connection(self):
+        connector_class, _ = fake_connector_class()
+        with self.assertRaises(ConnectionResetError), connector_class() as connector:
+            conn = connector.conn
+            raise ConnectionResetError
+        self.assertTrue(conn.closed)
+        with connector_class() as connector:
+            self.assertIsNot(connector.conn, conn)
+
+
+class DistributeTest(unittest.TestCase):
+    def test_delete_many_with_exhausted_pool(self):
+        connector_class, share = fake_connector_class(max_size=2, delay=0.01)
+        share.files.update({f"file_{i}": b"data" for i in range(10)})
+        with connector_class() as connector, connector_class():
+            run_with_timeout(lambda: connector.delete_many([f"file_{i}" for i in range(10)]))
+        self.assertEqual(share.files, {})
+
+    def test_retrieve_file_parallel_with_exhausted_pool(self):
+        connector_class, share = fake_connector_class(max_size=2)
+        share.files["big"] = data = bytes(range(256)) * 40
+
+        def read() -> bytes:
+            with connector.retrieve_file_parallel("big", block_size=1000) as file_obj:
+                return file_obj.read()
+
+        with connector_class() as connector, connector_class():
+            self.assertEqual(run_with_timeout(read), data)
+
+    def test_delete_many_with_concurrency_above_pool_size(self):
+        connector_class, share = fake_connector_class(max_size=3, delay=0.01)
+        share.files.update({f"file_{i}": b"data" for i in range(30)})
+        with connector_class() as connector:
+            run_with_timeout(lambda: connector.delete_many([f"file_{i}" for i in range(30)], max_concurrency=16))
+        self.assertEqual(share.files, {})
+        self.assertLessEqual(share.max_in_flight, 3)
+
+    def test_delete_many_uses_spare_connections(self):
+        connector_class, share = fake_connector_class(max_size=4, delay=0.01)
+        share.files.update({f"file_{i}": b"data" for i in range(20)})
+        with connector_class() as connector:
+            connector.delete_many([f"file_{i}" for i in range(20)], max_concurrency=4)
+        self.assertEqual(share.files, {})
+        self.assertGreater(share.max_in_flight, 1)
+        self.assertLessEqual(share.max_in_flight, 4)
+
+
+class FakeSMBOSError(OSError):
+    def __init__(self, ntstatus: int):
+        super().__init__(ntstatus)
+        self.ntstatus = ntstatus
+
+
+class ServerSideCopyTest(unittest.TestCase):
+    def setUp(self):
+        self.copy_error: BaseException | None = None
+        self.copy_calls = 0
+
+        def copyfile(src, dst, connection_cache, **kwargs):
+            self.copy_calls += 1
+            connection_cache.setdefault("host:445", object())
+            if self.copy_error is not None:
+                raise self.copy_error
+
+        smbprotocol = types.ModuleType("smbprotocol")
+        smbprotocol.exceptions = types.ModuleType("smbprotocol.exceptions")
+        smbprotocol.exceptions.SMBOSError = FakeSMBOSError
+        smbclient = types.ModuleType("smbclient")
+        smbclient.copyfile = copyfile
+        self.deleted_sessions = []
+        smbclient.delete_session = lambda server, port, connection_cache: self.deleted_sessions.append(
+            (server, port, dict(connection_cache))
+        )
+        modules = {"smbclient": smbclient, "smbprotocol": smbprotocol, "smbprotocol.exceptions": smbprotocol.exceptions}
+        patcher = mock.patch.dict(sys.modules, modules)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        connector_class, self.share = fake_connector_class()
+        self.share.files["source"] = b"data"
+        self.connector = connector_class()
+        self.connector._server_side_copy = True
+
+    def copy_twice(self) -> None:
+        with self.connector:
+            self.connector.copy_file("source", "first")
+            self.connector.copy_file("source", "second")
+        self.assertEqual(self.share.files["first"], b"data")
+        self.assertEqual(self.share.files["second"], b"data")
+
+    def test_copies_on_server_and_closes_the_session_on_exit(self):
+        with self.connector:
+            self.connector.copy_file("source", "first")
+        self.assertEqual(self.copy_calls, 1)
+        self.assertNotIn("first", self.share.files)
+        self.assertEqual(len(self.deleted_sessions), 1)
+        self.assertEqual(self.deleted_sessions[0][:2], ("host", 445))
+        self.assertIn("host:445", self.deleted_sessions[0][2])
+
+    def test_connection_failure_disables_server_side_copy(self):
+        self.copy_error = ConnectionRefusedError()
+        self.copy_twice()
+        self.assertEqual(self.copy_calls, 1)
+
+    def test_unsupported_copychunk_disables_server_side_copy(self):
+        self.copy_error = FakeSMBOSError(0xC00000BB)
+        self.copy_twice()
+        self.assertEqual(self.copy_calls, 1)
+
+    def test_file_error_falls_back_for_that_call_only(self):
+        self.copy_error = FakeSMBOSError(0xC0000043)
+        self.copy_twice()
+        self.assertEqual(self.copy_calls, 2)
+
+
+class CreateDirTest(unittest.TestCase):
+    def test_creates_missing_parents(self):
+        connector_class, share = fake_connector_class()
+        with connector_class() as connector:
+            connector.create_dir("a/b/c")
+        self.assertLessEqual({"a", "a/b", "a/b/c"}, share.dirs)
+
+    def test_ignores_collision_on_smb1(self):
+        connector_class, share = fake_connector_class(smb1=True)
+        with connector_class() as connector:
+            # the directory appears between the existence probe and its creation
+            with mock.patch.object(connector, "_exists", return_value=False):
+                share.dirs.add("a")
+                connector.create_dir("a/b")
+        self.assertIn("a/b", share.dirs)
+
+    def test_reraises_other_errors_on_smb1(self):
+        connector_class, _ = fake_connector_class(smb1=True)
+        with connector_class() as connector:
+            connector.conn.createDirectory = mock.Mock(side_effect=smb1_operation_failure(0xC0000022))
+            with self.assertRaises(OperationFailure):
+                connector.create_dir("a")
+
+
+class MoveFileTest(unittest.TestCase):
+    def test_renames_on_server(self):
+        connector_class, share = fake_connector_class()
+        share.files["old"] = b"data"
+        with connector_class() as connector:
+            connector.move_file("old", "new")
+        self.assertEqual(share.files, {"new": b"data"})
+
+    def test_existing_target_falls_back_to_copy_on_smb1(self):
+        connector_class, share = fake_connector_class(smb1=True)
+        share.files.update({"old": b"new data", "new": b"old data"})
+        with connector_class() as connector:
+            connector.move_file("old", "new")
+        self.assertEqual(share.files, {"new": b"new data"})
+
+    def test_reraises_other_errors_on_smb1(self):
+        connector_class, share = fake_connector_class(smb1=True)
+        share.files["old"] = b"data"
+        with connector_class() as connector:
+            connector.conn.rename = mock.Mock(side_effect=smb1_operation_failure(0xC0000022))
+            with self.assertRaises(OperationFailure):
+                connector.move_file("old", "new")
+        self.assertEqual(share.files, {"old": b"data"})
+
+
+class ListDirCacheTest(unittest.TestCase):
+    def setUp(self):
+        connector_class, self.share = fake_connector_class()
+        connector_class.settings = connector_class.settings.model_copy(update={"listdir_ttl": 60.0})
+        self.connector_class = connector_class
+
+    def names(self, connector, path: str) -> set[str]:
+        return {file.name for file in connector.list_dir(path)}
+
+    def test_results_are_cached(self):
+        with self.connector_class() as connector:
+            self.assertEqual(self.names(connector, ""), set())
+            self.share.files["outside"] = b"data"
+            self.assertEqual(self.names(connector, ""), set())
+
+    def test_own_writes_invalidate_with_absolute_work_dir(self):
+        self.share.dirs.update({"data", "data/x"})
+        with self.connector_class(work_dir="/data") as connector:
+            self.assertEqual(self.names(connector, "x"), set())
+            connector.create_dir("x/y")
+            self.assertEqual(self.names(connector, "x"), {"y"})
+            connector.store_file("x/file", b"data")
+            self.assertEqual(self.names(connector, "x/"), {"y", "file"})
+            connector.delete_files("x/file")
+            self.assertEqual(self.names(connector, "x"), {"y"})
+            connector.delete_dir("x/y")
+            self.assertEqual(self.names(connector, "/x"), set())
+
+
+class BulkTransferTest(unittest.TestCase):
+    def test_put_many_and_get_many(self):
+        connector_class, share = fake_connector_class(delay=0.01)
+        with connector_class() as connector:
+            stored = connector.put_many([(f"file_{i}", str(i).encode()) for i in range(10)], max_concurrency=4)
+            buffers = {f"file_{i}": io.BytesIO() for i in range(10)}
+            retrieved = connector.get_many([*buffers.items(), ("missing", io.BytesIO())], max_concurrency=4)
+        self.assertCountEqual(stored, [(f"file_{i}", True, len(str(i))) for i in range(10)])
+        self.assertCountEqual(
+            retrieved, [(f"file_{i}", True, len(str(i))) for i in range(10)] + [("missing", False, 0)]
+        )
+        self.assertEqual({path: buffer.getvalue() for path, buffer in buffers.items()}, share.files)
+        self.assertLessEqual(share.max_in_flight, 4)
+
+    def test_bulk_transfers_with_exhausted_pool(self):
+        connector_class, share = fake_connector_class(max_size=1)
+        with connector_class() as connector:
+            stored = run_with_timeout(lambda: connector.put_many([(f"file_{i}", b"data") for i in range(5)]))
+            retrieved = run_with_timeout(lambda: connector.get_many([("file_0", io.BytesIO())]))
+        self.assertEqual(len(share.files), 5)
+        self.assertTrue(all(ok for _, ok, _ in stored))
+        self.assertEqual(retrieved, [("file_0", True, 4)])
+
+    def test_put_many_from_every_pooled_connector(self):
+        connector_class, share = fake_connector_class(max_size=8, delay=0.01)
+        barrier = threading.Barrier(8)
+
+        def put(worker: int) -> None:
+            with connector_class() as connector:
+                # every slot of the pool is taken before the transfers start
+                barrier.wait()
+                connector.put_many([(f"{worker}_{i}", b"data") for i in range(4)])
+
+        # daemon threads, so a deadlock fails the test instead of keeping the interpreter alive
+        threads = [threading.Thread(target=put, args=(worker,), daemon=True) for worker in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+        self.assertFalse(any(thread.is_alive() for thread in threads))
+        self.assertEqual(len(share.files), 32)
+
+
+class ConnectTest(unittest.TestCase):
+    def setUp(self):
+        self.results: list[BaseException | bool] = []
+        self.connections = []
+
+        test = self
+
+        class FakeSMBConnection(FakeConnection):
+            def __init__(self, **kwargs):
+                super().__init__()
+                test.connections.append(self)
+
+            def connect(self, ip, port, timeout):
+                result = test.results.pop(0)
+                if isinstance(result, BaseException):
+                    raise result
+                return result
+
+        patcher = mock.patch("smb.SMBConnection.SMBConnection", FakeSMBConnection)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        sleep_patcher = mock.patch("holz_smb_connector.smb_connector.time.sleep")
+        self.sleep = sleep_patcher.start()
+        self.addCleanup(sleep_patcher.stop)
+        self.connector = SMBConnector(username="user", password="secret", host="host", shared_folder="share")
+
+    def test_retries_network_errors_with_backoff(self):
+        self.results = [ConnectionRefusedError(), socket.timeout(), True]
+        self.assertIs(self.connector._connect(), self.connections[-1])
+        self.assertEqual([c.args[0] for c in self.sleep.call_args_list], [0.1, 0.2])
+        self.assertTrue(all(conn.closed for conn in self.connections[:-1]))
+
+    def test_raises_after_the_last_attempt(self):
+        self.results = [ConnectionRefusedError()] * self.connector.settings.connect_attempts
+        with self.assertRaises(ConnectionRefusedError):
+            self.connector._connect()
+        self.assertEqual(len(self.connections), self.connector.settings.connect_attempts)
+
+    def test_failed_authentication_raises_connection_error(self):
+        self.results = [False]
+        with self.assertRaises(ConnectionError):
+            self.connector._connect()
+        self.assertEqual(self.sleep.call_count, 0)
+        self.assertTrue(self.connections[0].closed)
+
+    def test_connect_attempts_must_be_positive(self):
+        with self.assertRaises(ValidationError):
+            SMBSettings(connect_attempts=0)
+
+
+class RetrieveTest(unittest.TestCase):
+    def test_retrieve_file_bytes(self):
+        connector_class, share = fake_connector_class()
+        share.files["file"] = data = bytes(range(256)) * 100
+        with connector_class() as connector:
+            self.assertEqual(connector.retrieve_file_bytes("file"), data)
+            with self.assertRaises(OperationFailure):
+                connector.retrieve_file_bytes("missing")
+
+
+class StoreFileTest(unittest.TestCase):
+    def setUp(self):
+        connector_class, self.share = fake_connector_class()
+        connector_class.settings = connector_class.settings.model_copy(update={"tmp_spool_max": 16})
+        self.connector = connector_class()
+
+    def store(self, file_obj) -> bytes:
+        with self.connector:
+            self.assertTrue(self.connector.store_file("file", file_obj))
+        return self.share.files["file"]
+
+    def test_local_path(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = pathlib.Path(tmp_dir, "local")
+            path.write_bytes(b"from disk")
+            self.assertEqual(self.store(str(path)), b"from disk")
+            self.assertEqual(self.store(path), b"from disk")
+
+    def test_missing_local_path(self):
+        with self.connector, self.assertRaises(FileNotFoundError):
+            self.connector.store_file("file", "/nonexistent/file")
+        self.assertNotIn("file", self.share.files)
+
+    def test_bytes(self):
+        self.assertEqual(self.store(b"data"), b"data")
+
+    def test_small_buffers_stay_in_memory(self):
+        for buffer in (bytearray(b"data"), memoryview(b"data")):
+            with self.connector._open_source(buffer) as source:
+                self.assertIsInstance(source, io.BytesIO)
+            self.assertEqual(self.store(buffer), b"data")
+
+    def test_large_buffers_are_spooled(self):
+        data = bytes(range(64))
+        for buffer in (bytearray(data), memoryview(data)):
+            with self.connector._open_source(buffer) as source:
+                self.assertIsInstance(source, tempfile.SpooledTemporaryFile)
+            self.assertEqual(self.store(buffer), data)
+
+    def test_file_object_is_passed_through(self):
+        file_obj = io.BytesIO(b"data")
+        with self.connector._open_source(file_obj) as source:
+            self.assertIs(source, file_obj)
+        self.assertEqual(self.store(io.BytesIO(b"data")), b"data")
+
+    def test_empty_content_reports_nothing_stored(self):
+        with self.connector:
+            self.assertFalse(self.connector.store_file("file", b""))
+
+
+class WalkTest(unittest.TestCase):
+    def setUp(self):
+        connector_class, share = fake_connector_class()
+        share.dirs.update({"a", "a/b", "a/b/c", "d"})
+        share.files.update({"top": b"", "a/in_a": b"", "a/b/c/deep": b"", "d/in_d": b""})
+        self.connector = connector_class()
+
+    def test_listdir_iter_skips_special_dirs(self):
+        with self.connector:
+            entries = self.connector.listdir_iter("")
+            self.assertNotIsInstance(entries, list)
+            self.assertCountEqual(
+                list(entries),
+                [SMBFile("a", True, False), SMBFile("d", True, False), SMBFile("top", False, False)],
+            )
+
+    def test_walk_is_breadth_first(self):
+        with self.connector:
+            tops = [
+                (top, sorted(d.name for d in dirs), sorted(f.name for f in files))
+                for top, dirs, files in self.connector.walk("")
+            ]
+        self.assertEqual(
+            tops,
+            [
+                ("", ["a", "d"], ["top"]),
+                ("a", ["b"], ["in_a"]),
+                ("d", [], ["in_d"]),
+                ("a/b", ["c"], []),
+                ("a/b/c", [], ["deep"]),
+            ],
+        )
+
+    def test_walk_skips_pruned_dirs(self):
+        visited = []
+        with self.connector:
+            for top, dirs, _ in self.connector.walk(""):
+                visited.append(top)
+                dirs[:] = [d for d in dirs if d.name != "a"]
+        self.assertEqual(visited, ["", "d"])